@@ -1,8 +1,10 @@
-from conan import ConanFile
+from conan import ConanFile, conan_version
 from conan.tools.cmake import CMake, CMakeToolchain, CMakeDeps, cmake_layout
-from conan.tools.files import copy
+from conan.tools.files import copy, load, save
 from conan.tools.env import Environment, VirtualBuildEnv
+import hashlib
 import os
+import shutil
 
 
 class VoiceCommandConan(ConanFile):
@@ -21,33 +23,48 @@ class VoiceCommandConan(ConanFile):
         "fPIC": [True, False],
         "with_tests": [True, False],
         "with_examples": [True, False],
-        "with_vulkan": [True, False]
+        "with_vulkan": [True, False],
+        "with_ccache": [True, False],
+        "with_lto": [True, False]
     }
     default_options = {
         "shared": True,
         "fPIC": True,
         "with_tests": False,
         "with_examples": False,
-        "with_vulkan": False
+        "with_vulkan": False,
+        "with_ccache": True,
+        "with_lto": True
     }
 
     # Export sources for conan center
-    exports_sources = "CMakeLists.txt", "src/*", "include/*", "tests/*", "examples/*"
+    # Options are not available at export time, so tests/examples stay exported;
+    # the real application example is a standalone consumer project (with its own
+    # whisper-cpp recipe) and is never part of this build
+    exports_sources = ("CMakeLists.txt", "src/*", "include/*", "tests/*", "examples/*",
+                       "!examples/real_application_example/*")
 
     def config_options(self):
         if self.settings.os == "Windows":
             self.options.rm_safe("fPIC")
 
     def configure(self):
-        self.options["whisper-cpp"].shared=True
+        # Follow our own linkage so static builds can optimize across the whisper/ggml boundary
+        self.options["whisper-cpp"].shared = bool(self.options.shared)
         # if self.settings.os == "Android":
         if self.options.with_vulkan:
             self.options["whisper-cpp"].with_vulkan=True
         if self.options.shared:
             self.options.rm_safe("fPIC")
+        else:
+            self.options.rm_safe("with_lto")
+
+    def package_id(self):
+        # Compiler cache only affects build time, never the produced binaries
+        del self.info.options.with_ccache
 
     def layout(self):
-        cmake_layout(self)
+        cmake_layout(self, generator="Ninja")
 
     def requirements(self):
         """Core dependencies for library"""
@@ -61,55 +78,108 @@ class VoiceCommandConan(ConanFile):
         # JSON parsing for remote API responses
         self.requires("nlohmann_json/3.11.3")
 
-        # Testing framework (when tests are enabled)
-        if self.options.with_tests:
-            self.requires("gtest/1.14.0")
-            self.requires("benchmark/1.8.3")
-
     def build_requirements(self):
         """Build-time requirements"""
         self.tool_requires("cmake/[>=3.20]")
+        self.tool_requires("ninja/[>=1.11]")
+
+        # Testing framework (when tests are enabled and not skipped for this build).
+        # test_requires never reach consumers nor the package_id
+        if self.options.with_tests and not self.conf.get("tools.build:skip_test", default=False, check_type=bool):
+            self.test_requires("gtest/1.14.0")
+            self.test_requires("benchmark/1.8.3")
 
     def generate(self):
         """Generate CMake toolchain and dependencies"""
         deps = CMakeDeps(self)
         deps.generate()
 
-        tc = CMakeToolchain(self)
+        tc = CMakeToolchain(self, generator="Ninja")
         #tc.variables["VoiceCommand_BUILD_TESTS"] = self.options.with_tests
         #tc.variables["VoiceCommand_BUILD_EXAMPLES"] = self.options.with_examples
-        # tc.variables["Qt6_DIR"] = "F:/dev/programs/Qt/6.6.3/msvc2019_64/lib/cmake/Qt6"
-        tc.variables["Qt6_DIR"] = "/home/user/Qt/6.6.3/gcc_64/lib/cmake/Qt6"
+        # Qt comes from a local installation, so its location is machine/profile specific:
+        #   [conf]
+        #   user.voice_command:qt6_dir=/home/user/Qt/6.6.3/gcc_64/lib/cmake/Qt6
+        # When unset, CMake's regular find_package(Qt6) search applies (e.g. CMAKE_PREFIX_PATH)
+        qt6_dir = self.conf.get("user.voice_command:qt6_dir", default=None)
+        if qt6_dir:
+            tc.variables["Qt6_DIR"] = qt6_dir
         if self.settings.os == "Android":
             # Android specific configuration
             self.output.info("Building for Android!")
-            tc.variables["Qt6_DIR"] = "/home/user/Qt/6.6.3/android_arm64_v8a/lib/cmake/Qt6"
             # API Level check
             if self.settings.os.api_level:
                 self.output.info(f"Android API level: {self.settings.os.api_level}")
 
+        # Link-time optimization, only for shared libraries: their LTO is resolved at their own
+        # link step. Static archives would hold IR-only objects (CMake passes -fno-fat-lto-objects
+        # to GCC, clang emits bitcode) and force every consumer onto an LTO-capable toolchain.
+        # Always written, a reused build folder would otherwise keep a previous ON
+        with_lto = (self.options.get_safe("with_lto") and self.settings.build_type in ("Release", "RelWithDebInfo")
+                    and self.settings.compiler in ("gcc", "clang", "apple-clang", "msvc"))
+        tc.cache_variables["CMAKE_INTERPROCEDURAL_OPTIMIZATION"] = "ON" if with_lto else "OFF"
+
+        # Compiler cache: unchanged translation units become a cache lookup. Always written, an
+        # empty launcher clears the one a reused build folder was configured with
+        launcher = ""
+        if self.options.with_ccache:
+            launcher = shutil.which("ccache") or shutil.which("sccache") or ""
+            if not launcher:
+                self.output.info("with_ccache enabled, but neither ccache nor sccache found in PATH")
+        tc.cache_variables["CMAKE_C_COMPILER_LAUNCHER"] = launcher
+        tc.cache_variables["CMAKE_CXX_COMPILER_LAUNCHER"] = launcher
+
         tc.generate()
 
+    @property
+    def _toolchain_hash(self):
+        """Hash of the generated toolchain and presets (cache variables) the build folder was configured with"""
+        toolchain_files = ("conan_toolchain.cmake", "CMakePresets.json")
+        content = "".join(load(self, os.path.join(self.generators_folder, f)) for f in toolchain_files)
+        return hashlib.sha256(content.encode()).hexdigest()
+
     def build(self):
         """Build the project"""
         cmake = CMake(self)
-        cmake.configure()
+        # Configure only when the build folder has no cache yet or the toolchain changed. Changes to
+        # CMakeLists.txt or find_package() config files are picked up by the build step itself
+        toolchain_hash_file = os.path.join(self.build_folder, ".conan_tc_hash")
+        toolchain_hash = self._toolchain_hash
+        if (os.path.isfile(os.path.join(self.build_folder, "CMakeCache.txt"))
+                and os.path.isfile(toolchain_hash_file) and load(self, toolchain_hash_file) == toolchain_hash):
+            self.output.info("Toolchain unchanged, skipping CMake configure")
+        else:
+            cmake.configure()
+            save(self, toolchain_hash_file, toolchain_hash)
+        # Parallel by default: for Ninja Conan passes -j<tools.build:jobs>, which defaults to the CPU count
         cmake.build()
 
         # if self.options.with_tests:
             # cmake.test()
 
+    def _copy_binaries(self, patterns, src, dst):
+        """Copy the files matching any of patterns from src to dst, flattened"""
+        # Skip CMake internals and fetched dependencies of the build tree
+        excludes = ("CMakeFiles", "*/CMakeFiles", "_deps", "*/_deps")
+        # Conan >= 2.32 accepts a pattern list and walks src only once
+        if conan_version >= "2.32":
+            copy(self, patterns, src=src, dst=dst, keep_path=False, excludes=excludes)
+        else:
+            for pattern in patterns:
+                copy(self, pattern, src=src, dst=dst, keep_path=False, excludes=excludes)
+
     def package(self):
         """Package the library"""
         copy(self, "*.h", src=os.path.join(self.source_folder, "include"), dst=os.path.join(self.package_folder, "include"))
 
-        # if self.options.shared:
-        copy(self, "*.dll", src=self.build_folder, dst=os.path.join(self.package_folder, "bin"), keep_path=False)
-        copy(self, "*.dylib*", src=self.build_folder, dst=os.path.join(self.package_folder, "lib"), keep_path=False)
-        copy(self, "*.so*", src=self.build_folder, dst=os.path.join(self.package_folder, "lib"), keep_path=False)
-        # else:
-        copy(self, "*.a", src=self.build_folder, dst=os.path.join(self.package_folder, "lib"), keep_path=False)
-        copy(self, "*.lib", src=self.build_folder, dst=os.path.join(self.package_folder, "lib"), keep_path=False)
+        # Every library kind is copied: CMakeLists.txt always builds voice_command as SHARED,
+        # independent of the shared option. "*.a" also covers MinGW "*.dll.a" import libraries,
+        # "*.lib" MSVC ones. Only the output folders declared by cmake_layout are scanned
+        self._copy_binaries(["*.dll"], src=os.path.join(self.build_folder, self.cpp.build.bindirs[0]),
+                            dst=os.path.join(self.package_folder, "bin"))
+        self._copy_binaries(["*.dylib*", "*.so*", "*.a", "*.lib"],
+                            src=os.path.join(self.build_folder, self.cpp.build.libdirs[0]),
+                            dst=os.path.join(self.package_folder, "lib"))
 
     def package_info(self):
         """Provide package information to consumers"""
@@ -1,16 +1,80 @@
+import functools
+import glob
+import hashlib
+import json
 import os
+import shutil
 import textwrap
 
-from conan import ConanFile
+from conan import ConanFile, conan_version
 from conan.errors import ConanInvalidConfiguration
 from conan.tools.apple import is_apple_os
-from conan.tools.build import check_min_cppstd
+from conan.tools.build import check_min_cppstd, cross_building
 from conan.tools.cmake import CMake, CMakeDeps, CMakeToolchain, cmake_layout
-from conan.tools.files import copy, get, rm, save
+from conan.tools.files import copy, get, load, rm, save
 from conan.tools.scm import Version
 
 required_conan_version = ">=2.1"
 
+# Conan arch -> NDK target triple, names the per-ABI folders of the NDK sysroot
+_ANDROID_ABI_MAP = {
+    "armv8": "aarch64-linux-android",
+    "armv7": "arm-linux-androideabi",
+    "x86": "i686-linux-android",
+    "x86_64": "x86_64-linux-android",
+}
+
+# CMake build modules shipped with static GPU-enabled packages
+_CUDA_BUILD_MODULE = textwrap.dedent("""\
+    find_dependency(CUDAToolkit REQUIRED)
+    if (WIN32)
+        target_link_libraries(whisper-cpp::whisper-cpp INTERFACE CUDA::cudart_static CUDA::cublas CUDA::cublasLt CUDA::cuda_driver)
+    else ()
+        target_link_libraries(whisper-cpp::whisper-cpp INTERFACE CUDA::cudart_static CUDA::cublas_static CUDA::cublasLt_static CUDA::cuda_driver)
+    endif()
+""")
+
+_VULKAN_BUILD_MODULE = textwrap.dedent("""\
+    find_dependency(Vulkan REQUIRED)
+    target_link_libraries(whisper-cpp::whisper-cpp INTERFACE Vulkan::Vulkan)
+""")
+
+
+# Build machine OS -> NDK prebuilt host tag (the NDK only ships x86_64 host toolchains)
+_NDK_HOST_TAGS = {
+    "Linux": "linux-x86_64",
+    "Macos": "darwin-x86_64",
+    "Windows": "windows-x86_64",
+}
+
+# Conan evaluates the recipe several times per process (graph, generate, package_info),
+# the lookups below do not change in between
+@functools.lru_cache(maxsize=None)
+def _find_glslc():
+    return shutil.which("glslc")
+
+
+@functools.lru_cache(maxsize=None)
+def _android_ndk_prebuilt(ndk_path, build_os):
+    """NDK LLVM toolchain folder for the build machine, None without an NDK or for hosts it ships no toolchain for"""
+    host_tag = _NDK_HOST_TAGS.get(build_os)
+    if not ndk_path or host_tag is None:
+        return None
+    return os.path.join(ndk_path, "toolchains", "llvm", "prebuilt", host_tag)
+
+
+@functools.lru_cache(maxsize=None)
+def _android_vulkan_lib_dir(ndk_path, build_os, arch, api_level):
+    """NDK sysroot folder holding the libvulkan.so to link against for the given ABI"""
+    prebuilt = _android_ndk_prebuilt(ndk_path, build_os)
+    if prebuilt is None:
+        return None
+    android_abi = _ANDROID_ABI_MAP.get(arch, "aarch64-linux-android")
+    # Vulkan 1.1 requires minimum API level 29 (Android 10)
+    # whisper.cpp uses Vulkan 1.1 features like vkGetPhysicalDeviceFeatures2
+    vulkan_api_level = max(api_level, 29)
+    return os.path.join(prebuilt, "sysroot", "usr", "lib", android_abi, str(vulkan_api_level))
+
 
 class WhisperCppConan(ConanFile):
     name = "whisper-cpp"
@@ -31,6 +95,12 @@ class WhisperCppConan(ConanFile):
         "no_avx2": [True, False],
         "no_fma": [True, False],
         "no_f16c": [True, False],
+        "with_avx512": [True, False],
+        "with_avx512_vnni": [True, False],
+        "with_amx": [True, False],  # implies AVX512 and AVX512-VNNI, ggml's AMX kernels need both
+        "with_dotprod": [True, False],
+        "with_i8mm": [True, False],
+        "with_sve": [True, False],
         "no_accelerate": [True, False],
         "metal": [True, False],
         "metal_ndebug": [True, False],
@@ -40,6 +110,9 @@ class WhisperCppConan(ConanFile):
         "with_openvino": [True, False],
         "with_cuda": [True, False],
         "with_vulkan": [True, False],
+        "with_openmp": [True, False],
+        "with_ccache": [True, False],
+        "with_lto": [True, False],
     }
     default_options = {
         "shared": False,
@@ -51,6 +124,12 @@ class WhisperCppConan(ConanFile):
         "no_avx2": False,
         "no_fma": False,
         "no_f16c": False,
+        "with_avx512": False,
+        "with_avx512_vnni": False,
+        "with_amx": False,
+        "with_dotprod": False,
+        "with_i8mm": False,
+        "with_sve": False,
         "no_accelerate": False,
         "metal": True,
         "metal_ndebug": False,
@@ -60,43 +139,65 @@ class WhisperCppConan(ConanFile):
         "with_openvino": False,
         "with_cuda": False,
         "with_vulkan": False,
+        "with_openmp": True,
+        "with_ccache": True,
+        "with_lto": True,
     }
     package_type = "library"
-    exports_sources = "CMakeLists.txt", "src/*", "include/*", "ggml/*", "cmake/*", "bindings/*", "LICENSE"
 
-    @property
-    def _min_cppstd(self):
-        return "14"
+    _min_cppstd = "14"
+    # Minimum compiler versions supporting _min_cppstd
+    _compilers_minimum_version = {
+        "gcc": "9",
+        "clang": "5",
+        "apple-clang": "10",
+        "Visual Studio": "15",
+        "msvc": "191",
+    }
 
     @property
-    def _compilers_minimum_version(self):
-        return {
-            "14": {
-                "gcc": "9",
-                "clang": "5",
-                "apple-clang": "10",
-                "Visual Studio": "15",
-                "msvc": "191",
-            },
-        }.get(self._min_cppstd, {})
+    def _upstream_sources(self):
+        # conandata.yml "sources" entry (url + sha256) of this version, None for local checkouts
+        return (self.conan_data or {}).get("sources", {}).get(str(self.version))
 
     @property
-    def _cuda_build_module(self):
-        return textwrap.dedent("""\
-            find_dependency(CUDAToolkit REQUIRED)
-            if (WIN32)
-                target_link_libraries(whisper-cpp::whisper-cpp INTERFACE CUDA::cudart_static CUDA::cublas CUDA::cublasLt CUDA::cuda_driver)
-            else ()
-                target_link_libraries(whisper-cpp::whisper-cpp INTERFACE CUDA::cudart_static CUDA::cublas_static CUDA::cublasLt_static CUDA::cuda_driver)
-            endif()
-        """)
+    def _strip_program(self):
+        # Static archives must be stripped with the target toolchain's strip, which is only
+        # known for native Linux/FreeBSD builds and for the Android NDK
+        if self.settings.os == "Android":
+            ndk_path = self.conf.get("tools.android:ndk_path")
+            prebuilt = _android_ndk_prebuilt(ndk_path, str(self.settings_build.os))
+            if prebuilt:
+                executable = "llvm-strip.exe" if self.settings_build.os == "Windows" else "llvm-strip"
+                strip = os.path.join(prebuilt, "bin", executable)
+                if os.path.isfile(strip):
+                    return strip
+                self.output.warning(f"{strip} not found, static libraries are packaged unstripped")
+        elif self.settings.os in ("Linux", "FreeBSD") and not cross_building(self):
+            return shutil.which("strip")
+        return None
 
     @property
-    def _vulkan_build_module(self):
-        return textwrap.dedent("""\
-            find_dependency(Vulkan REQUIRED)
-            target_link_libraries(whisper-cpp::whisper-cpp INTERFACE Vulkan::Vulkan)
-        """)
+    def _dependencies_fingerprint(self):
+        # Everything the CMakeDeps output depends on: the generator implementation, the
+        # set_property() customizations in this recipe, our own settings (data file names and
+        # per-config variables) and CMakeDeps conf, and each dependency's binary and package_info()
+        cmakedeps_conf = sorted((name, str(value)) for name, value in self.conf.items()
+                                if name.startswith("tools.cmake.cmakedeps"))
+        entries = [str(conan_version), load(self, os.path.join(self.recipe_folder, "conanfile.py")),
+                   self.settings.dumps(), json.dumps(cmakedeps_conf)]
+        entries.extend(sorted(
+            f"{dep.pref} {dep.package_folder} {json.dumps(dep.cpp_info.serialize(), sort_keys=True, default=str)}"
+            for dep in self.dependencies.host.values()))
+        return hashlib.sha256("\n".join(entries).encode()).hexdigest()
+
+    def export_sources(self):
+        # Released versions are fetched in source(): sha256 verified, served from
+        # core.download:download_cache and not embedded in the recipe export. Local forks such as
+        # "vulkan" have no upstream archive and ship the whisper.cpp/ggml tree with the recipe
+        if self._upstream_sources is None:
+            for pattern in ("CMakeLists.txt", "src/*", "include/*", "ggml/*", "cmake/*", "bindings/*", "LICENSE"):
+                copy(self, pattern, src=self.recipe_folder, dst=self.export_sources_folder)
 
     def config_options(self):
         if is_apple_os(self):
@@ -113,9 +214,25 @@ class WhisperCppConan(ConanFile):
         if self.settings.os == "Windows":
             del self.options.fPIC
 
+        if self.settings.arch not in ("x86", "x86_64"):
+            del self.options.with_avx512
+            del self.options.with_avx512_vnni
+            del self.options.with_amx
+        if not str(self.settings.arch).startswith("armv8"):
+            del self.options.with_dotprod
+            del self.options.with_i8mm
+            del self.options.with_sve
+
+        # ggml's CPU backend parallelizes its kernels with OpenMP, but apple-clang ships no
+        # OpenMP runtime and the NDK's libomp.so is not deployed into the APK, so opt-in there
+        if is_apple_os(self) or self.settings.os == "Android":
+            self.options.with_openmp = False
+
     def configure(self):
         if self.options.shared:
             self.options.rm_safe("fPIC")
+        else:
+            self.options.rm_safe("with_lto")
 
         if is_apple_os(self):
             if not self.options.with_coreml:
@@ -130,6 +247,10 @@ class WhisperCppConan(ConanFile):
                 f"{self.ref} requires C++{self._min_cppstd}, which your compiler does not support."
             )
 
+    def package_id(self):
+        # Compiler cache only affects build time, never the produced binaries
+        del self.info.options.with_ccache
+
     def requirements(self):
         if not is_apple_os(self):
             if self.options.get_safe("with_blas"):
@@ -143,16 +264,32 @@ class WhisperCppConan(ConanFile):
                     self.requires("vulkan-loader/1.3.290.0")
         if self.options.get_safe("with_openvino"):
             self.requires("openvino/2023.2.0")
+        if self.options.with_openmp and is_apple_os(self):
+            self.requires("llvm-openmp/17.0.6")
+
+    def source(self):
+        if self._upstream_sources is not None:
+            get(self, **self._upstream_sources, strip_root=True)
+
+    def build_requirements(self):
+        self.tool_requires("ninja/[>=1.11]")
 
     def layout(self):
-        cmake_layout(self, src_folder=".")
+        cmake_layout(self, src_folder=".", generator="Ninja")
 
     def generate(self):
-        deps = CMakeDeps(self)
-        deps.set_property("openblas", "cmake_file_name", "BLAS")
-        deps.generate()
+        # Repeated installs into the same folder would rewrite identical *-config.cmake files
+        fingerprint_file = os.path.join(self.generators_folder, ".conan_deps_hash")
+        fingerprint = self._dependencies_fingerprint
+        if os.path.isfile(fingerprint_file) and load(self, fingerprint_file) == fingerprint:
+            self.output.info("Dependencies unchanged, skipping CMakeDeps generation")
+        else:
+            deps = CMakeDeps(self)
+            deps.set_property("openblas", "cmake_file_name", "BLAS")
+            deps.generate()
+            save(self, fingerprint_file, fingerprint)
 
-        tc = CMakeToolchain(self)
+        tc = CMakeToolchain(self, generator="Ninja")
         tc.variables["WHISPER_BUILD_TESTS"] = False
         tc.variables["WHISPER_BUILD_EXAMPLES"] = False
         # Disable standalone mode to skip JavaScript bindings configuration
@@ -175,7 +312,31 @@ class WhisperCppConan(ConanFile):
         if self.options.no_f16c:
             tc.variables["WHISPER_NO_F16C"] = True
 
-        tc.variables["GGML_OPENMP"] = False
+        # ggml ignores its per-ISA switches while GGML_NATIVE (-march=native) is on, so an explicit
+        # AVX-512/AMX request builds for the listed instruction sets instead of the build machine.
+        # ggml compiles its AMX kernels only under __AMX_INT8__ && __AVX512VNNI__, so AMX pulls in VNNI
+        with_amx = bool(self.options.get_safe("with_amx", False))
+        with_avx512_vnni = bool(self.options.get_safe("with_avx512_vnni", False)) or with_amx
+        with_avx512 = bool(self.options.get_safe("with_avx512", False)) or with_avx512_vnni or with_amx
+        if with_avx512:
+            tc.variables["GGML_NATIVE"] = False
+            tc.variables["GGML_AVX"] = not self.options.no_avx
+            tc.variables["GGML_AVX2"] = not self.options.no_avx2
+            tc.variables["GGML_FMA"] = not self.options.no_fma
+            tc.variables["GGML_F16C"] = not self.options.no_f16c
+            tc.variables["GGML_AVX512"] = True
+            tc.variables["GGML_AVX512_VNNI"] = with_avx512_vnni
+            tc.variables["GGML_AMX_TILE"] = with_amx
+            tc.variables["GGML_AMX_INT8"] = with_amx
+
+        # Same for ARM: sdot/smmla/SVE kernels are compiled in only through an explicit -march.
+        # Off by default, many armv8 Android devices (Cortex-A53) lack these extensions
+        arm_extensions = [ext for ext in ("dotprod", "i8mm", "sve") if self.options.get_safe(f"with_{ext}")]
+        if arm_extensions:
+            tc.variables["GGML_NATIVE"] = False
+            tc.variables["GGML_CPU_ARM_ARCH"] = "+".join(["armv8.2-a"] + arm_extensions)
+
+        tc.variables["GGML_OPENMP"] = bool(self.options.get_safe("with_openmp", False))
         tc.variables["GGML_CUDA"] = bool(self.options.get_safe("with_cuda", False))
         tc.variables["GGML_VULKAN"] = bool(self.options.get_safe("with_vulkan", False))
 
@@ -193,22 +354,12 @@ class WhisperCppConan(ConanFile):
 
             # Help FindVulkan locate the library in NDK's API-level specific directory
             if self.options.get_safe("with_vulkan"):
-                arch_map = {
-                    "armv8": "aarch64-linux-android",
-                    "armv7": "arm-linux-androideabi",
-                    "x86": "i686-linux-android",
-                    "x86_64": "x86_64-linux-android",
-                }
-                android_abi = arch_map.get(str(self.settings.arch), "aarch64-linux-android")
-                api_level = int(str(self.settings.os.api_level))
-                # Vulkan 1.1 requires minimum API level 29 (Android 10)
-                # whisper.cpp uses Vulkan 1.1 features like vkGetPhysicalDeviceFeatures2
-                vulkan_api_level = max(api_level, 29)
                 # Get NDK path from Conan config and construct absolute sysroot path
                 ndk_path = self.conf.get("tools.android:ndk_path")
-                if ndk_path:
-                    sysroot = os.path.join(ndk_path, "toolchains", "llvm", "prebuilt", "linux-x86_64", "sysroot")
-                    tc.cache_variables["Vulkan_LIBRARY"] = os.path.join(sysroot, "usr", "lib", android_abi, str(vulkan_api_level), "libvulkan.so")
+                vulkan_lib_dir = _android_vulkan_lib_dir(ndk_path, str(self.settings_build.os), str(self.settings.arch),
+                                                         int(str(self.settings.os.api_level)))
+                if vulkan_lib_dir:
+                    tc.cache_variables["Vulkan_LIBRARY"] = os.path.join(vulkan_lib_dir, "libvulkan.so")
                 # Use vulkan-headers from Conan (has C++ headers) instead of NDK (C only)
                 vulkan_headers = self.dependencies["vulkan-headers"]
                 vulkan_include = vulkan_headers.cpp_info.includedirs[0]
@@ -217,8 +368,7 @@ class WhisperCppConan(ConanFile):
         # Desktop Linux Vulkan: Conan's FindVulkan.cmake doesn't provide glslc
         # We need glslc from system for shader compilation
         if self.settings.os == "Linux" and self.options.get_safe("with_vulkan"):
-            import shutil
-            glslc_path = shutil.which("glslc")
+            glslc_path = _find_glslc()
             if glslc_path:
                 tc.cache_variables["Vulkan_GLSLC_EXECUTABLE"] = glslc_path
             else:
@@ -244,6 +394,26 @@ class WhisperCppConan(ConanFile):
                     tc.variables["WHISPER_COREML_ALLOW_FALLBACK"] = True
             tc.variables["GGML_METAL"] = bool(self.options.get_safe("metal", False))
 
+        # Link-time optimization, only for shared libraries: their LTO is resolved at their own
+        # link step. Static archives would hold IR-only objects (CMake passes -fno-fat-lto-objects
+        # to GCC, clang emits bitcode) and force every consumer onto an LTO-capable toolchain.
+        # Always written, a reused build folder would otherwise keep a previous ON
+        with_lto = (self.options.get_safe("with_lto") and self.settings.build_type in ("Release", "RelWithDebInfo")
+                    and self.settings.compiler in ("gcc", "clang", "apple-clang", "msvc"))
+        tc.cache_variables["CMAKE_INTERPROCEDURAL_OPTIMIZATION"] = "ON" if with_lto else "OFF"
+
+        # Compiler cache: ggml has hundreds of translation units, most unchanged between builds.
+        # Always written, an empty launcher clears the one a reused build folder was configured with
+        launcher = ""
+        if self.options.with_ccache:
+            launcher = shutil.which("ccache") or shutil.which("sccache") or ""
+            if not launcher:
+                self.output.info("with_ccache enabled, but neither ccache nor sccache found in PATH")
+        tc.cache_variables["CMAKE_C_COMPILER_LAUNCHER"] = launcher
+        tc.cache_variables["CMAKE_CXX_COMPILER_LAUNCHER"] = launcher
+        if self.options.get_safe("with_cuda"):
+            tc.cache_variables["CMAKE_CUDA_COMPILER_LAUNCHER"] = launcher
+
         tc.generate()
 
     def build(self):
@@ -258,11 +428,20 @@ class WhisperCppConan(ConanFile):
         rm(self, "*.cmake", self.package_folder, recursive=True)
         rm(self, "*.pc", self.package_folder, recursive=True)
 
+        # Release packages carry no debug information, GPU backend archives are large enough
+        # for it to matter on upload/download
+        if self.settings.build_type == "Release":
+            rm(self, "*.pdb", self.package_folder, recursive=True)
+            strip = self._strip_program
+            if strip and not self.options.shared:
+                for static_lib in glob.glob(os.path.join(self.package_folder, "lib", "*.a")):
+                    self.run(f'"{strip}" --strip-unneeded "{static_lib}"')
+
         # Save build modules for static linking with GPU backends
         if self.options.get_safe("with_cuda") and not self.options.shared:
-            save(self, os.path.join(self.package_folder, "lib", "cmake", "whisper-cpp-cuda-static.cmake"), self._cuda_build_module)
+            save(self, os.path.join(self.package_folder, "lib", "cmake", "whisper-cpp-cuda-static.cmake"), _CUDA_BUILD_MODULE)
         if self.options.get_safe("with_vulkan") and not self.options.shared:
-            save(self, os.path.join(self.package_folder, "lib", "cmake", "whisper-cpp-vulkan-static.cmake"), self._vulkan_build_module)
+            save(self, os.path.join(self.package_folder, "lib", "cmake", "whisper-cpp-vulkan-static.cmake"), _VULKAN_BUILD_MODULE)
 
     def package_info(self):
         self.cpp_info.libs = ["whisper"]
@@ -280,6 +459,8 @@ class WhisperCppConan(ConanFile):
             self.cpp_info.requires.append("openvino::Runtime")
         if self.options.get_safe("with_vulkan") and self.settings.os != "Android":
             self.cpp_info.requires.append("vulkan-loader::vulkan-loader")
+        if self.options.with_openmp and is_apple_os(self):
+            self.cpp_info.requires.append("llvm-openmp::llvm-openmp")
 
         if is_apple_os(self):
             if not self.options.no_accelerate:
@@ -301,18 +482,19 @@ class WhisperCppConan(ConanFile):
                 # bundle the NDK stub libvulkan.so, which crashes at runtime
                 # Using linker flags avoids this while still allowing linking
                 ndk_path = self.conf.get("tools.android:ndk_path")
-                if ndk_path:
-                    arch_map = {
-                        "armv8": "aarch64-linux-android",
-                        "armv7": "arm-linux-androideabi",
-                        "x86": "i686-linux-android",
-                        "x86_64": "x86_64-linux-android",
-                    }
-                    android_abi = arch_map.get(str(self.settings.arch), "aarch64-linux-android")
-                    vulkan_lib_dir = os.path.join(ndk_path, "toolchains", "llvm", "prebuilt", "linux-x86_64", "sysroot", "usr", "lib", android_abi, "29")
+                vulkan_lib_dir = _android_vulkan_lib_dir(ndk_path, str(self.settings_build.os), str(self.settings.arch),
+                                                         int(str(self.settings.os.api_level)))
+                if vulkan_lib_dir:
                     self.cpp_info.sharedlinkflags.append(f"-L{vulkan_lib_dir}")
                     self.cpp_info.exelinkflags.append(f"-L{vulkan_lib_dir}")
 
+        # Static ggml-cpu links the OpenMP runtime privately, consumers must pull it in.
+        # MSVC embeds vcomp as a default library, Apple gets it through llvm-openmp::llvm-openmp
+        if self.options.with_openmp and not self.options.shared and not is_apple_os(self):
+            if self.settings.compiler in ("gcc", "clang"):
+                self.cpp_info.sharedlinkflags.append("-fopenmp")
+                self.cpp_info.exelinkflags.append("-fopenmp")
+
         # Build modules for static linking
         build_modules = []
         if self.options.get_safe("with_cuda") and not self.options.shared:
@@ -1,11 +1,10 @@
 from conan import ConanFile
-from conan.tools.cmake import CMake, cmake_layout
+from conan.tools.cmake import CMake, CMakeDeps, CMakeToolchain, cmake_layout
 
 class MyApplication(ConanFile):
     name = "my_application"
     version = "1.0"
     settings = "os", "compiler", "build_type", "arch"
-    generators = "CMakeDeps", "CMakeToolchain"
 
     # Define dependencies
     def requirements(self):
@@ -13,11 +12,19 @@ class MyApplication(ConanFile):
         # self.requires("nlohmann_json/3.12.0")
 
     # Define build tools
-    #def build_requirements(self):
+    def build_requirements(self):
         #self.tool_requires("cmake/3.26.4")
+        self.tool_requires("ninja/[>=1.11]")
 
     def layout(self):
-        cmake_layout(self)
+        cmake_layout(self, generator="Ninja")
+
+    def generate(self):
+        deps = CMakeDeps(self)
+        deps.generate()
+
+        tc = CMakeToolchain(self, generator="Ninja")
+        tc.generate()
 
     def build(self):
         cmake = CMake(self)